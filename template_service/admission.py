@@ -0,0 +1,110 @@
+"""Admission control and load shedding per route class.
+
+Each route class (render vs. admin CRUD) gets a bounded number of requests in
+flight and a bounded wait queue. A request that finds the queue full, or that
+waits longer than the queue timeout, is answered immediately with 503 and a
+Retry-After header instead of piling up in the server until it times out.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from logger import get_logger
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED, ADMISSION_WAIT_SECONDS
+
+logger = get_logger(__name__)
+
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+class AdmissionController:
+    def __init__(self, route_class: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.route_class = route_class
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+        self._in_flight = ADMISSION_IN_FLIGHT.labels(route_class=route_class)
+        self._queue_depth = ADMISSION_QUEUE_DEPTH.labels(route_class=route_class)
+        self._wait_seconds = ADMISSION_WAIT_SECONDS.labels(route_class=route_class)
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a slot; returns None when admitted, else the shed reason."""
+        if not self._sem.locked():
+            await self._sem.acquire()
+            self._wait_seconds.observe(0)
+            self._in_flight.inc()
+            return None
+        if self._waiting >= self.max_queue:
+            return "queue_full"
+
+        self._waiting += 1
+        self._queue_depth.inc()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            self._waiting -= 1
+            self._queue_depth.dec()
+            self._wait_seconds.observe(time.perf_counter() - start)
+        self._in_flight.inc()
+        return None
+
+    def release(self) -> None:
+        self._in_flight.dec()
+        self._sem.release()
+
+
+controllers = {
+    "render": AdmissionController(
+        "render",
+        max_concurrent=int(os.getenv("ADMISSION_RENDER_CONCURRENCY", "16")),
+        max_queue=int(os.getenv("ADMISSION_RENDER_QUEUE", "64")),
+        queue_timeout=float(os.getenv("ADMISSION_RENDER_QUEUE_TIMEOUT", "2")),
+    ),
+    "admin": AdmissionController(
+        "admin",
+        max_concurrent=int(os.getenv("ADMISSION_ADMIN_CONCURRENCY", "8")),
+        max_queue=int(os.getenv("ADMISSION_ADMIN_QUEUE", "32")),
+        queue_timeout=float(os.getenv("ADMISSION_ADMIN_QUEUE_TIMEOUT", "5")),
+    ),
+}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Classify a request; health, metrics, docs and CORS preflights are never throttled."""
+    if method == "OPTIONS":
+        return None
+    if path.rstrip("/") == "/api/v1/templates/render":
+        return "render"
+    if path.startswith("/api/v1/templates"):
+        return "admin"
+    return None
+
+
+async def admission_middleware(request: Request, call_next):
+    name = route_class(request.method, request.url.path)
+    if name is None:
+        return await call_next(request)
+
+    controller = controllers[name]
+    shed_reason = await controller.acquire()
+    if shed_reason is not None:
+        ADMISSION_SHED.labels(route_class=name, reason=shed_reason).inc()
+        logger.warning(f"Shedding {request.method} {request.url.path}: {name} {shed_reason}")
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": "ServiceUnavailable", "message": "Server is busy, retry later", "meta": {}},
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        controller.release()
@@ -0,0 +1,85 @@
+"""Compare the old pydantic response path with the orjson fast path.
+
+Simulates a `GET /api/v1/templates?limit=100` page of templates with large
+HTML bodies and times only the serialization work done per request.
+
+    python bench_serialization.py [--rows 100] [--content-kb 20] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from responses import ORJSONResponse, public_fields  # noqa: E402
+from schemas import APIResponse, PaginationMeta, TemplateResponse, TemplateVariableResponse  # noqa: E402
+from services import template_to_dict  # noqa: E402
+
+LIST_FIELDS = ('id', 'name', 'type', 'subject', 'content', 'version')
+
+
+def make_rows(n: int, content_kb: int):
+    now = datetime.now(timezone.utc)
+    body = "<p>" + ("Hello {{ name }}, " * 64 * content_kb)[: content_kb * 1024] + "</p>"
+    rows = []
+    for i in range(n):
+        t = SimpleNamespace(
+            id=i, name=f"template_{i}", type="email", subject="Hi {{ name }}", content=body,
+            language="en", version=3, is_active=True, created_at=now, updated_at=now,
+        )
+        variables = [
+            SimpleNamespace(id=i * 10 + j, name=f"var_{j}", link=None, description="d", is_required=j == 0)
+            for j in range(3)
+        ]
+        rows.append((t, variables))
+    return rows
+
+
+def legacy(rows, meta):
+    out = []
+    for t, variables in rows:
+        vars_resp = [TemplateVariableResponse.model_validate(v) for v in variables]
+        it_dict = TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp}).model_dump()
+        it_dict['id'] = str(it_dict['id'])
+        out.append({k: it_dict.get(k) for k in LIST_FIELDS})
+    resp = APIResponse(success=True, data=out, error=None, message="ok", meta=PaginationMeta.model_validate(meta))
+    # what FastAPI does for a returned model without response_model
+    return json.dumps(jsonable_encoder(resp)).encode()
+
+
+def fast(rows, meta):
+    out = [public_fields(template_to_dict(t, variables), LIST_FIELDS) for t, variables in rows]
+    return ORJSONResponse(content={"success": True, "data": out, "error": None, "message": "ok", "meta": meta}).body
+
+
+def bench(fn, rows, meta, repeat):
+    fn(rows, meta)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows, meta)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--content-kb", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.content_kb)
+    meta = {"total": args.rows, "limit": args.rows, "page": 1, "total_pages": 1, "has_next": False, "has_previous": False}
+    legacy_ms = bench(legacy, rows, meta, args.repeat)
+    fast_ms = bench(fast, rows, meta, args.repeat)
+    print(f"rows={args.rows} content={args.content_kb}KB")
+    print(f"legacy pydantic path: {legacy_ms:8.3f} ms/request")
+    print(f"orjson fast path:     {fast_ms:8.3f} ms/request ({legacy_ms / fast_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
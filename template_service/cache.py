@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import SINGLEFLIGHT_COALESCED, SINGLEFLIGHT_WAITING
+
+
+class TTLCache:
+    """Small thread-safe LRU cache with per-entry expiry.
+
+    Keys are grouped by a `group` (the template name) so that every entry
+    belonging to a template can be dropped in one call when it changes.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[Hashable, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._groups: Dict[Hashable, set] = {}
+
+    def get(self, group: Hashable, key: Hashable, default: Any = None) -> Any:
+        full_key = (group, key)
+        with self._lock:
+            entry = self._data.get(full_key, self._MISSING)
+            if entry is self._MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(full_key)
+                return default
+            self._data.move_to_end(full_key)
+            return value
+
+    def set(self, group: Hashable, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        full_key = (group, key)
+        with self._lock:
+            self._data[full_key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(full_key)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest, _ = next(iter(self._data.items()))
+                self._remove(oldest)
+
+    def invalidate(self, group: Hashable) -> None:
+        with self._lock:
+            for key in self._groups.pop(group, ()):
+                self._data.pop((group, key), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._groups.clear()
+
+    def _remove(self, full_key: Tuple[Hashable, Hashable]) -> None:
+        self._data.pop(full_key, None)
+        group, key = full_key
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._groups.pop(group, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the loader; callers arriving while it runs
+    wait and receive its result (or its exception) instead of repeating the work.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._coalesced = SINGLEFLIGHT_COALESCED.labels(flight=name)
+        self._waiting = SINGLEFLIGHT_WAITING.labels(flight=name)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._coalesced.inc()
+            self._waiting.inc()
+            try:
+                call.event.wait()
+            finally:
+                self._waiting.dec()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
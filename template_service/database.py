@@ -1,22 +1,111 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import  sessionmaker, declarative_base
 from dotenv import load_dotenv
+from logger import get_logger
+from metrics import DB_READ_SESSIONS
 import os
+import time
 
 load_dotenv()
+logger = get_logger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL") 
+# optional read replica used by read-only endpoints (lookups, listings, renders)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# after a commit on the primary, reads stay on the primary this long (read-your-writes)
+REPLICA_PIN_SECONDS = float(os.getenv("DATABASE_REPLICA_PIN_SECONDS", "2"))
+# after a failed replica connection, skip the replica this long
+REPLICA_RETRY_SECONDS = float(os.getenv("DATABASE_REPLICA_RETRY_SECONDS", "30"))
+# fail fast when a database host is unreachable instead of waiting for the OS TCP timeout
+CONNECT_TIMEOUT_SECONDS = int(os.getenv("DATABASE_CONNECT_TIMEOUT", "3"))
 
-engine = create_engine(DATABASE_URL)
+
+def _connect_args(url: str) -> dict:
+    if make_url(url).get_backend_name() in ("postgresql", "mysql"):
+        return {"connect_timeout": CONNECT_TIMEOUT_SECONDS}
+    return {}
+
+
+engine = create_engine(DATABASE_URL, connect_args=_connect_args(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+replica_engine = create_engine(DATABASE_REPLICA_URL, pool_pre_ping=True, connect_args=_connect_args(DATABASE_REPLICA_URL)) if DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+
 Base = declarative_base()
 
-Base.metadata.create_all(bind=engine)
+_last_primary_write = 0.0
+_replica_down_until = 0.0
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_primary_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_bulk_delete")
+@event.listens_for(SessionLocal, "after_bulk_update")
+def _mark_primary_bulk_write(update_context):
+    # legacy Query.update()/delete(), which bypass the flush
+    if update_context.result.rowcount:
+        update_context.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_primary_write(session):
+    # only commits that actually wrote pin reads; read-only commits don't
+    global _last_primary_write
+    if session.info.pop("wrote", False):
+        _last_primary_write = time.monotonic()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_primary_write(session):
+    session.info.pop("wrote", None)
+
+
+def open_read_session():
+    """Read session: the replica when configured and safe, else the primary."""
+    global _replica_down_until
+    if ReplicaSessionLocal is None:
+        DB_READ_SESSIONS.labels(target="primary", reason="no_replica").inc()
+        return SessionLocal()
+    now = time.monotonic()
+    if now - _last_primary_write < REPLICA_PIN_SECONDS:
+        DB_READ_SESSIONS.labels(target="primary", reason="pinned_after_write").inc()
+        return SessionLocal()
+    if now < _replica_down_until:
+        DB_READ_SESSIONS.labels(target="primary", reason="replica_unavailable").inc()
+        return SessionLocal()
+
+    db = ReplicaSessionLocal()
+    try:
+        # check out (and pre-ping) the connection now so a dead replica falls back here
+        db.connection()
+    except OperationalError:
+        logger.exception("Read replica unavailable, falling back to primary")
+        db.close()
+        _replica_down_until = now + REPLICA_RETRY_SECONDS
+        DB_READ_SESSIONS.labels(target="primary", reason="replica_error").inc()
+        return SessionLocal()
+    DB_READ_SESSIONS.labels(target="replica", reason="replica").inc()
+    return db
+
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    """Session for read-only endpoints; see `open_read_session`."""
+    db = open_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,105 @@
+"""Jinja loading of shared layouts and partials from the template catalog.
+
+Templates can `{% extends %}`, `{% include %}` or `{% import %}` other
+templates by name: "base_layout" resolves with the default language chain,
+"base_layout@pt-BR" with the chain of that locale. Referenced templates are
+compiled once and cached by the Jinja environment; a dependency graph
+records which templates reference which, so that changing a layout
+invalidates exactly the templates built on it.
+"""
+import threading
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from jinja2 import BaseLoader, Environment, TemplateNotFound, meta
+
+# fetch(name, language) -> (source, uptodate) or None when the template does not exist
+Fetch = Callable[[str, Optional[str]], Optional[Tuple[str, Callable[[], bool]]]]
+
+
+def split_reference(reference: str) -> Tuple[str, Optional[str]]:
+    """"layout@pt-BR" -> ("layout", "pt-BR"); "layout" -> ("layout", None)."""
+    name, _, language = reference.partition("@")
+    return name, language or None
+
+
+def referenced_templates(environment: Environment, source: str) -> Set[str]:
+    """Names of the templates statically referenced by `source` (dynamic references are ignored)."""
+    return {ref for ref in meta.find_referenced_templates(environment.parse(source)) if ref}
+
+
+def collect_sources(environment: Environment, sources: Iterable[str]) -> Dict[str, str]:
+    """Source of every template referenced, directly or transitively, by `sources`."""
+    collected: Dict[str, str] = {}
+    pending = set()
+    for source in sources:
+        if source:
+            pending |= referenced_templates(environment, source)
+    while pending:
+        reference = pending.pop()
+        if reference in collected:
+            continue
+        text, _, _ = environment.loader.get_source(environment, reference)
+        collected[reference] = text
+        pending |= referenced_templates(environment, text) - collected.keys()
+    return collected
+
+
+class DependencyGraph:
+    """Which templates reference which, plus a generation counter per template name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+
+    def generation(self, name: str) -> int:
+        return self._generations.get(name, 0)
+
+    def record(self, name: str, references: Iterable[str]) -> None:
+        """Record that template `name` references each of `references`."""
+        with self._lock:
+            for reference in references:
+                target, _ = split_reference(reference)
+                if target != name:
+                    self._dependents.setdefault(target, set()).add(name)
+
+    def dependents(self, name: str) -> Set[str]:
+        """All templates that (transitively) reference `name`."""
+        with self._lock:
+            found: Set[str] = set()
+            pending = [name]
+            while pending:
+                for dependent in self._dependents.get(pending.pop(), ()):
+                    if dependent not in found and dependent != name:
+                        found.add(dependent)
+                        pending.append(dependent)
+            return found
+
+    def invalidate(self, name: str) -> Set[str]:
+        """Bump the generation of `name` and of everything built on it; returns all affected names."""
+        affected = {name} | self.dependents(name)
+        with self._lock:
+            for affected_name in affected:
+                self._generations[affected_name] = self._generations.get(affected_name, 0) + 1
+        return affected
+
+
+class CatalogLoader(BaseLoader):
+    """Jinja loader resolving template references through `fetch`.
+
+    When a `graph` is given, the references of every loaded template are recorded in it.
+    """
+
+    def __init__(self, fetch: Fetch, graph: Optional[DependencyGraph] = None):
+        self.fetch = fetch
+        self.graph = graph
+
+    def get_source(self, environment: Environment, template: str):
+        name, language = split_reference(template)
+        found = self.fetch(name, language)
+        if found is None:
+            raise TemplateNotFound(template)
+        source, uptodate = found
+        if self.graph is not None:
+            self.graph.record(name, referenced_templates(environment, source))
+        return source, None, uptodate
@@ -0,0 +1,28 @@
+import os
+from typing import List, Optional, Tuple
+
+DEFAULT_LANGUAGE = os.getenv("TEMPLATE_DEFAULT_LANGUAGE", "en")
+
+
+def build_language_chain(language: Optional[str]) -> Tuple[str, ...]:
+    """Expand a requested locale into an ordered fallback chain.
+
+    Accepts a single locale or a comma-separated preference list (an
+    Accept-Language style value; q-weights are ignored, order is kept):
+    "pt-BR" -> ("pt-BR", "pt", "en"), "fr-CA,de" -> ("fr-CA", "fr", "de", "en").
+    """
+    chain: List[str] = []
+
+    def add(lang: str) -> None:
+        if lang and lang not in chain:
+            chain.append(lang)
+
+    for part in (language or "").split(","):
+        lang = part.split(";", 1)[0].strip().replace("_", "-")
+        if not lang or lang == "*":
+            continue
+        add(lang)
+        if "-" in lang:
+            add(lang.split("-", 1)[0])
+    add(DEFAULT_LANGUAGE)
+    return tuple(chain)
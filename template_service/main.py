@@ -2,13 +2,46 @@ from prometheus_fastapi_instrumentator import Instrumentator
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from logger import logger
+from admission import admission_middleware
 from database import engine, Base, SessionLocal
 from routes import router as templates_router
+from snapshot import SNAPSHOT_MODE, snapshot_store
+from render_pool import shutdown_pool
+from purge import PURGE_ENABLED, PurgeWorker
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 
-Base.metadata.create_all(bind=engine)
+if SNAPSHOT_MODE != "only":
+  try:
+    Base.metadata.create_all(bind=engine)
+  except DBAPIError:
+    # with a snapshot to fall back on, a worker restarted during a database outage still comes up
+    if SNAPSHOT_MODE == "off":
+      raise
+    logger.exception("Database unavailable at startup; skipping schema creation")
 app = FastAPI(title="Template Service", version="1.0.0")
 
+if SNAPSHOT_MODE != "off" and not snapshot_store.refresh():
+  logger.warning(f"Snapshot mode '{SNAPSHOT_MODE}' but no catalog snapshot loaded from {snapshot_store.path}")
+
+
+purge_worker = PurgeWorker(SessionLocal)
+
+
+@app.on_event("startup")
+def start_purge_worker():
+  if PURGE_ENABLED and SNAPSHOT_MODE != "only":
+    purge_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_background_work():
+  purge_worker.stop()
+  shutdown_pool()
+
+# bounded concurrency + wait queue per route class; sheds with 503 before work piles up.
+# Registered before CORS so CORS wraps it and shed responses still carry CORS headers.
+app.middleware("http")(admission_middleware)
 app.add_middleware(
   CORSMiddleware,
   allow_origins=["*"],
@@ -0,0 +1,55 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exposed on /metrics together with the HTTP metrics from prometheus_fastapi_instrumentator
+# (both use the default registry).
+
+DB_READ_SESSIONS = Counter(
+    "template_db_read_sessions_total",
+    "Read-only sessions opened, by database used and routing reason",
+    ["target", "reason"],
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "template_admission_in_flight",
+    "Requests currently admitted, by route class",
+    ["route_class"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "template_admission_queue_depth",
+    "Requests waiting for admission, by route class",
+    ["route_class"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "template_admission_wait_seconds",
+    "Time spent waiting for admission, by route class",
+    ["route_class"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+ADMISSION_SHED = Counter(
+    "template_admission_shed_total",
+    "Requests rejected with 503 by admission control, by route class and reason",
+    ["route_class", "reason"],
+)
+
+RENDER_BUDGET_EXCEEDED = Counter(
+    "template_render_budget_exceeded_total",
+    "Renders aborted for exceeding their time or output budget",
+    ["reason"],
+)
+
+SINGLEFLIGHT_COALESCED = Counter(
+    "template_singleflight_coalesced_total",
+    "Callers that waited for an in-flight load of the same key instead of loading it themselves",
+    ["flight"],
+)
+SINGLEFLIGHT_WAITING = Gauge(
+    "template_singleflight_waiting",
+    "Callers currently waiting for an in-flight load",
+    ["flight"],
+)
+
+PURGED_ROWS = Counter(
+    "template_purged_rows_total",
+    "Rows removed by the background purge of soft-deleted templates",
+    ["table"],
+)
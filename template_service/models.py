@@ -7,14 +7,22 @@ from sqlalchemy import (
     Text,
     ForeignKey,
     func,
-    UniqueConstraint,
+    Index,
+    text,
 )
 from database import Base
 
 
 class template_model(Base):
     __tablename__ = "templates"
-    __table_args__ = (UniqueConstraint('name', 'language', name='uq_template_name_language'),)
+    # unique among active templates only: a soft-deleted row keeps its name and
+    # language until the purge worker removes it, without blocking a re-create
+    __table_args__ = (
+        Index(
+            'uq_template_name_language', 'name', 'language', unique=True,
+            postgresql_where=text('is_active'), sqlite_where=text('is_active'),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), index=True, nullable=False)
@@ -27,6 +35,15 @@ class template_model(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
+    __mapper_args__ = {
+        # optimistic concurrency: UPDATEs run as "... WHERE version = <loaded version>";
+        # the service sets the next version itself
+        "version_id_col": version,
+        "version_id_generator": False,
+        # fetch server-generated timestamps in the same statement (RETURNING)
+        "eager_defaults": True,
+    }
+
 
 class template_variable_model(Base):
     __tablename__ = "template_variables"
@@ -0,0 +1,129 @@
+"""Background purge of soft-deleted templates.
+
+Deleting a template only flips `is_active`. Once a template has been
+inactive for longer than PURGE_RETENTION_HOURS (measured from `updated_at`,
+which the soft delete sets), its version history, variables and finally the
+template row itself are removed in small batches, each in its own short
+transaction, so no request ever waits on a large cascading delete.
+
+Runs as a daemon thread in each API worker (PURGE_ENABLED, default on) or
+once from the command line: `python purge.py`.
+"""
+import os
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from logger import get_logger
+from metrics import PURGED_ROWS
+from models import template_model, template_variable_model, template_version_model
+
+logger = get_logger(__name__)
+
+PURGE_ENABLED = os.getenv("PURGE_ENABLED", "true").lower() in ("1", "true", "yes")
+PURGE_RETENTION_HOURS = float(os.getenv("PURGE_RETENTION_HOURS", "168"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "300"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+
+
+def _delete_in_batches(db: Session, model, template_id: int, batch_size: int) -> int:
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.query(model.id).filter(model.template_id == template_id).limit(batch_size).all()]
+        if not ids:
+            return deleted
+        db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+        PURGED_ROWS.labels(table=model.__tablename__).inc(len(ids))
+
+
+def purge_template(db: Session, template_id: int, batch_size: int = PURGE_BATCH_SIZE) -> Optional[int]:
+    """Remove one inactive template: its history and variables in batches, then the row.
+
+    Returns the number of versions removed, or None if the template was not
+    (or no longer) inactive.
+    """
+    versions = _delete_in_batches(db, template_version_model, template_id, batch_size)
+    _delete_in_batches(db, template_variable_model, template_id, batch_size)
+    # only if it is still inactive; the children are already gone, so this is a single-row delete
+    removed = db.query(template_model).filter(
+        template_model.id == template_id,
+        template_model.is_active == False,
+    ).delete(synchronize_session=False)
+    db.commit()
+    if not removed:
+        return None
+    PURGED_ROWS.labels(table=template_model.__tablename__).inc(removed)
+    return versions
+
+
+def purge_inactive_templates(db: Session, retention: timedelta, batch_size: int = PURGE_BATCH_SIZE, max_templates: Optional[int] = None) -> int:
+    """Remove inactive templates (and their history) deactivated more than `retention` ago; returns how many."""
+    cutoff = datetime.now(timezone.utc) - retention
+    q = db.query(template_model.id, template_model.name).filter(
+        template_model.is_active == False,
+        template_model.updated_at < cutoff,
+    ).order_by(template_model.updated_at)
+    if max_templates is not None:
+        q = q.limit(max_templates)
+    candidates = q.all()
+
+    purged = 0
+    for template_id, name in candidates:
+        versions = purge_template(db, template_id, batch_size)
+        if versions is not None:
+            purged += 1
+            logger.info(f"Purged template {name} (id={template_id}, {versions} versions)")
+    return purged
+
+
+class PurgeWorker:
+    """Runs `purge_inactive_templates` every `interval` seconds in a daemon thread."""
+
+    def __init__(self, session_factory, interval: float = PURGE_INTERVAL_SECONDS, retention_hours: float = PURGE_RETENTION_HOURS, batch_size: int = PURGE_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.retention = timedelta(hours=retention_hours)
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="template-purge", daemon=True)
+        self._thread.start()
+        logger.info(f"Purge worker started (retention {self.retention}, every {self.interval}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_once(self) -> int:
+        db = self.session_factory()
+        try:
+            return purge_inactive_templates(db, self.retention, self.batch_size)
+        except Exception:
+            db.rollback()
+            logger.exception("Template purge failed")
+            return 0
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        # spread the API workers' runs out instead of having them all purge at once
+        while not self._stop.wait(self.interval * random.uniform(0.5, 1.5)):
+            self.run_once()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    count = PurgeWorker(SessionLocal).run_once()
+    print(f"Purged {count} templates")
@@ -0,0 +1,185 @@
+"""Template rendering with per-render budgets, optionally in a process pool.
+
+With TEMPLATE_RENDER_EXECUTOR=process, Jinja runs in worker processes, so a
+heavy template no longer holds the GIL of the API worker and render
+throughput scales with cores. Each worker keeps its own cache of compiled
+templates. Every render is bounded by:
+
+- an output budget (TEMPLATE_RENDER_MAX_OUTPUT characters per rendered field),
+  enforced while streaming the template output, in both executors;
+- a time budget (TEMPLATE_RENDER_TIME_BUDGET seconds). In the process executor
+  it is CPU time, enforced inside the worker with a virtual-time interval
+  timer, and the caller also stops waiting after TEMPLATE_RENDER_WALL_TIMEOUT
+  seconds. In the thread executor it is a deadline checked between output
+  chunks, so it cannot stop a loop that produces no output.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from jinja2 import Environment, FunctionLoader, TemplateNotFound
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+RENDER_EXECUTOR = os.getenv("TEMPLATE_RENDER_EXECUTOR", "thread").lower()  # thread | process
+RENDER_PROCESSES = int(os.getenv("TEMPLATE_RENDER_PROCESSES", "0")) or os.cpu_count() or 1
+RENDER_TIME_BUDGET = float(os.getenv("TEMPLATE_RENDER_TIME_BUDGET", "2"))
+RENDER_WALL_TIMEOUT = float(os.getenv("TEMPLATE_RENDER_WALL_TIMEOUT", "10"))
+RENDER_MAX_OUTPUT = int(os.getenv("TEMPLATE_RENDER_MAX_OUTPUT", str(1024 * 1024)))
+WORKER_CACHE_SIZE = int(os.getenv("TEMPLATE_RENDER_WORKER_CACHE_SIZE", "512"))
+
+
+class RenderBudgetExceeded(Exception):
+    """A render ran out of its time or output budget. `reason` is 'time' or 'output'."""
+
+    def __init__(self, reason: str, message: str):
+        self.reason = reason
+        self.message = message
+        super().__init__(reason, message)
+
+
+def render_deadline(time_budget: float = RENDER_TIME_BUDGET) -> Optional[float]:
+    """`time.monotonic()` deadline for a render starting now; None without a budget."""
+    return time.monotonic() + time_budget if time_budget else None
+
+
+def render_with_budget(tpl, data: Dict[str, Any], max_output: int = RENDER_MAX_OUTPUT, deadline: Optional[float] = None) -> str:
+    """Render `tpl`, aborting as soon as the output grows past `max_output` characters
+    or, between output chunks, once `deadline` (a `time.monotonic()` value) has passed."""
+    parts = []
+    size = 0
+    for chunk in tpl.generate(**data):
+        size += len(chunk)
+        if max_output and size > max_output:
+            raise RenderBudgetExceeded("output", f"Rendered output exceeds {max_output} characters")
+        if deadline is not None and time.monotonic() > deadline:
+            raise RenderBudgetExceeded("time", f"Rendering exceeded its time budget of {RENDER_TIME_BUDGET}s")
+        parts.append(chunk)
+    return "".join(parts)
+
+
+# --- worker process side ---------------------------------------------------
+
+_worker_env: Optional[Environment] = None
+_worker_cache: "OrderedDict[Tuple[Hashable, str, int], Any]" = OrderedDict()
+
+
+class _CPUBudgetExpired(BaseException):
+    pass
+
+
+def _on_cpu_budget(signum, frame):
+    raise _CPUBudgetExpired()
+
+
+# layouts/partials referenced by the template being rendered, shipped with each job
+_job_includes: Dict[str, str] = {}
+
+
+def _job_include(name: str):
+    source = _job_includes.get(name)
+    if source is None:
+        return None
+    # compiled includes stay cached in the worker env while their source is unchanged
+    return source, None, lambda: _job_includes.get(name) == source
+
+
+def _worker_init() -> None:
+    global _worker_env
+    # same defaults as the in-thread environment
+    _worker_env = Environment(loader=FunctionLoader(_job_include))
+    signal.signal(signal.SIGVTALRM, _on_cpu_budget)
+
+
+def _worker_template(key: Hashable, field: str, text: str):
+    cache_key = (key, field, hash(text))
+    tpl = _worker_cache.get(cache_key)
+    if tpl is None:
+        tpl = _worker_env.from_string(text)
+        _worker_cache[cache_key] = tpl
+        while len(_worker_cache) > WORKER_CACHE_SIZE:
+            _worker_cache.popitem(last=False)
+    else:
+        _worker_cache.move_to_end(cache_key)
+    return tpl
+
+
+def _render_job(key: Hashable, subject: Optional[str], content: str, data: Dict[str, Any], includes: Optional[Dict[str, str]], time_budget: float, max_output: int) -> Tuple[Optional[str], str]:
+    global _job_includes
+    _job_includes = includes or {}
+    signal.setitimer(signal.ITIMER_VIRTUAL, time_budget)
+    try:
+        rendered_subject = render_with_budget(_worker_template(key, "subject", subject), data, max_output) if subject else None
+        rendered_content = render_with_budget(_worker_template(key, "content", content), data, max_output)
+        return rendered_subject, rendered_content
+    except _CPUBudgetExpired:
+        raise RenderBudgetExceeded("time", f"Rendering exceeded its CPU budget of {time_budget}s")
+    except (RenderBudgetExceeded, TemplateNotFound):
+        raise
+    except Exception as e:
+        # Jinja exceptions don't all survive pickling back to the parent
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+
+
+# --- API process side ------------------------------------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: workers must not inherit DB connections or threads of the API process
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+            logger.info(f"Started render process pool with {RENDER_PROCESSES} workers")
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def render_in_pool(key: Hashable, subject: Optional[str], content: str, data: Dict[str, Any], includes: Optional[Dict[str, str]] = None) -> Tuple[Optional[str], str]:
+    """Render subject and content in a worker process.
+
+    `key` identifies the template for the worker cache; `includes` maps every
+    layout/partial the template references to its source.
+    """
+    future = _get_pool().submit(_render_job, key, subject, content, data, includes, RENDER_TIME_BUDGET, RENDER_MAX_OUTPUT)
+    try:
+        return future.result(timeout=RENDER_WALL_TIMEOUT)
+    except FuturesTimeout:
+        future.cancel()
+        raise RenderBudgetExceeded("time", f"Rendering did not finish within {RENDER_WALL_TIMEOUT}s")
+    except _CPUBudgetExpired:
+        # the timer fired between the end of the render and disarming it
+        raise RenderBudgetExceeded("time", f"Rendering exceeded its CPU budget of {RENDER_TIME_BUDGET}s")
+    except BrokenProcessPool:
+        logger.exception("Render process pool broke; restarting it")
+        _reset_pool()
+        raise
+
+
+def shutdown_pool() -> None:
+    _reset_pool()
@@ -0,0 +1,34 @@
+from typing import Any, Dict, Iterable, Optional
+
+import orjson
+from fastapi.responses import Response
+
+
+class ORJSONResponse(Response):
+    """JSON response encoded once with orjson.
+
+    Returning a Response instance from a route skips FastAPI's response
+    validation and `jsonable_encoder` pass, so the payload is only walked
+    by the encoder itself.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def api_success(data: Any, message: str, meta: Optional[Dict[str, Any]] = None, status_code: int = 200) -> ORJSONResponse:
+    """Build the standard success envelope (same shape as schemas.APIResponse)."""
+    return ORJSONResponse(
+        status_code=status_code,
+        content={"success": True, "data": data, "error": None, "message": message, "meta": meta},
+    )
+
+
+def public_fields(item: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Pick the client-facing fields of a template dict; ids are exposed as strings."""
+    out = {k: item.get(k) for k in fields}
+    if out.get("id") is not None:
+        out["id"] = str(out["id"])
+    return out
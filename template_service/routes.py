@@ -1,33 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
 from typing import Optional
-from database import get_db
+from database import get_db, get_read_db
 from sqlalchemy.orm import Session
-from services import TemplateService
+from services import TemplateService, TEMPLATE_FIELDS, VERSION_FIELDS
 from services import ServiceException
 from schemas import (
 	RenderResponse,
 	TemplateCreate,
 	TemplateUpdate,
-	APIResponse,
 	APIErrorResponse,
-	PaginationMeta,
 	RenderRequest,
 )
 from logger import logger
 from fastapi.responses import JSONResponse
+from responses import api_success, public_fields
 
 router = APIRouter()
 
 
+def _expected_version(if_match: Optional[str], payload: TemplateUpdate) -> Optional[int]:
+	"""Version precondition for updates: the If-Match header (an ETag such as "3") wins over payload.version."""
+	if if_match is None:
+		return payload.version
+	value = if_match.strip()
+	if value.startswith("W/"):
+		value = value[2:]
+	value = value.strip('"')
+	if value == "*":
+		return None
+	try:
+		return int(value)
+	except ValueError:
+		raise ServiceException(400, "Validation failed", "If-Match must be a template version ETag")
+
+
+def _select_fields(fields: Optional[str], allowed, default):
+	"""Fields requested with `?fields=a,b`, or `default`; unknown names are rejected."""
+	if fields is None:
+		return tuple(default)
+	selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+	unknown = [f for f in selected if f not in allowed]
+	if unknown or not selected:
+		raise ServiceException(400, "Validation failed", f"Unknown field(s): {', '.join(unknown)}" if unknown else "fields must not be empty")
+	return selected
+
+
+def _query_fields(selected):
+	"""Columns to ask the service for: the selected ones that exist, plus version for the ETag."""
+	return tuple(dict.fromkeys([*(f for f in selected if f in TEMPLATE_FIELDS), 'version']))
+
+
+FIELDS_DESCRIPTION = "Comma-separated fields to return; only these are loaded from the database"
+
+
+def _with_etag(response, version: Optional[int]):
+	if version is not None:
+		response.headers["ETag"] = f'"{version}"'
+	return response
+
+
 @router.post("/api/v1/templates", status_code=status.HTTP_201_CREATED)
 def create_template(payload: TemplateCreate, db: Session = Depends(get_db)):
 	try:
 		tpl = TemplateService.create_template(db, payload)
 		# return data object with id inside payload (id as string to match API contract)
-		tpl_dict = tpl.model_dump() if hasattr(tpl, 'model_dump') else dict(tpl)
+		tpl_dict = dict(tpl)
 		if 'id' in tpl_dict:
 			tpl_dict['id'] = str(tpl_dict['id'])
-		return APIResponse(success=True, data=tpl_dict, error=None, message="Template created successfully", meta=None)
+		return api_success(tpl_dict, "Template created successfully", status_code=status.HTTP_201_CREATED)
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -38,35 +78,27 @@ def create_template(payload: TemplateCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/api/v1/templates")
-def list_templates(page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100), search: Optional[str] = None, db: Session = Depends(get_db)):
+def list_templates(page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100), search: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), db: Session = Depends(get_read_db)):
 	try:
-		items, meta = TemplateService.list_templates(db, page=page, limit=limit, search=search)
+		selected = _select_fields(fields, TEMPLATE_FIELDS, ('id', 'name', 'type', 'subject', 'content', 'version'))
+		items, meta = TemplateService.list_templates(db, page=page, limit=limit, search=search, fields=[f for f in selected if f in TEMPLATE_FIELDS])
 		# Normalize items to list of plain dicts and ensure id is string
-		out_items = []
-		for it in items:
-			it_dict = it.model_dump() if hasattr(it, 'model_dump') else dict(it)
-			if 'id' in it_dict:
-				it_dict['id'] = str(it_dict['id'])
-			# include only the public fields expected by clients
-			public = {k: it_dict.get(k) for k in ('id', 'name', 'type', 'subject', 'content','version')}
-			out_items.append(public)
-		return APIResponse(success=True, data=out_items, error=None, message="Templates fetched successfully", meta=PaginationMeta.model_validate(meta))
+		# include only the public fields expected by clients
+		out_items = [public_fields(it, selected) for it in items]
+		return api_success(out_items, "Templates fetched successfully", meta=meta)
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
 
 
 @router.get("/api/v1/templates/{name}")
-def get_template(name: str, db: Session = Depends(get_db)):
+def get_template(name: str, language: Optional[str] = Query(None, description="Locale or comma-separated fallback list, e.g. 'pt-BR,pt'"), fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), db: Session = Depends(get_read_db)):
 	try:
-		tpl = TemplateService.get_template_by_name(db, name)
+		selected = _select_fields(fields, TEMPLATE_FIELDS, ('id', 'name', 'type', 'subject', 'body', 'language'))
+		tpl = TemplateService.get_template_by_name(db, name, language, fields=_query_fields(selected))
 		if not tpl:
 			raise HTTPException(status_code=404, detail="Template not found")
-		tpl_dict = tpl.model_dump() if hasattr(tpl, 'model_dump') else dict(tpl)
-		if 'id' in tpl_dict:
-			tpl_dict['id'] = str(tpl_dict['id'])
-		public = {k: tpl_dict.get(k) for k in ('id', 'name', 'type', 'subject', 'body')}
-		return APIResponse(success=True, data=public, error=None, message="Template retrieved successfully", meta=None)
+		return _with_etag(api_success(public_fields(tpl, selected), "Template retrieved successfully"), tpl.get('version'))
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -77,14 +109,10 @@ def get_template(name: str, db: Session = Depends(get_db)):
 
 
 @router.put("/api/v1/templates/{name}")
-def update_template(name: str, payload: TemplateUpdate, db: Session = Depends(get_db)):
+def update_template(name: str, payload: TemplateUpdate, if_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
 	try:
-		tpl = TemplateService.update_template(db, name, payload)
-		tpl_dict = tpl.model_dump() if hasattr(tpl, 'model_dump') else dict(tpl)
-		if 'id' in tpl_dict:
-			tpl_dict['id'] = str(tpl_dict['id'])
-		public = {k: tpl_dict.get(k) for k in ('id', 'name', 'type', 'subject', 'body')}
-		return APIResponse(success=True, data=public, error=None, message="Template updated successfully", meta=None)
+		tpl = TemplateService.update_template(db, name, payload, expected_version=_expected_version(if_match, payload))
+		return _with_etag(api_success(public_fields(tpl, ('id', 'name', 'type', 'subject', 'body', 'version')), "Template updated successfully"), tpl.get('version'))
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -98,7 +126,7 @@ def update_template(name: str, payload: TemplateUpdate, db: Session = Depends(ge
 def delete_template(name: str, db: Session = Depends(get_db)):
 	try:
 		ok = TemplateService.delete_template(db, name)
-		return APIResponse(success=True, data=None, error=None, message="Template deleted successfully", meta=None)
+		return api_success(None, "Template deleted successfully")
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -109,14 +137,11 @@ def delete_template(name: str, db: Session = Depends(get_db)):
 
 
 @router.get("/api/v1/templates/id/{template_id}")
-def get_template_by_id(template_id: int, db: Session = Depends(get_db)):
+def get_template_by_id(template_id: int, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), db: Session = Depends(get_read_db)):
 	try:
-		tpl = TemplateService.get_template_by_id(db, template_id)
-		tpl_dict = tpl.model_dump() if hasattr(tpl, 'model_dump') else dict(tpl)
-		if 'id' in tpl_dict:
-			tpl_dict['id'] = str(tpl_dict['id'])
-		public = {k: tpl_dict.get(k) for k in ('id', 'name', 'type', 'subject', 'body')}
-		return APIResponse(success=True, data=public, error=None, message="Template retrieved successfully", meta=None)
+		selected = _select_fields(fields, TEMPLATE_FIELDS, ('id', 'name', 'type', 'subject', 'body'))
+		tpl = TemplateService.get_template_by_id(db, template_id, fields=_query_fields(selected))
+		return _with_etag(api_success(public_fields(tpl, selected), "Template retrieved successfully"), tpl.get('version'))
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -127,14 +152,10 @@ def get_template_by_id(template_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/api/v1/templates/id/{template_id}")
-def update_template_by_id(template_id: int, payload: TemplateUpdate, db: Session = Depends(get_db)):
+def update_template_by_id(template_id: int, payload: TemplateUpdate, if_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
 	try:
-		tpl = TemplateService.update_template_by_id(db, template_id, payload)
-		tpl_dict = tpl.model_dump() if hasattr(tpl, 'model_dump') else dict(tpl)
-		if 'id' in tpl_dict:
-			tpl_dict['id'] = str(tpl_dict['id'])
-		public = {k: tpl_dict.get(k) for k in ('id', 'name', 'type', 'subject', 'body')}
-		return APIResponse(success=True, data=public, error=None, message="Template updated successfully", meta=None)
+		tpl = TemplateService.update_template_by_id(db, template_id, payload, expected_version=_expected_version(if_match, payload))
+		return _with_etag(api_success(public_fields(tpl, ('id', 'name', 'type', 'subject', 'body', 'version')), "Template updated successfully"), tpl.get('version'))
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -148,7 +169,7 @@ def update_template_by_id(template_id: int, payload: TemplateUpdate, db: Session
 def delete_template_by_id(template_id: int, db: Session = Depends(get_db)):
 	try:
 		ok = TemplateService.delete_template_by_id(db, template_id)
-		return APIResponse(success=True, data=None, error=None, message="Template deleted successfully", meta=None)
+		return api_success(None, "Template deleted successfully")
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -159,14 +180,14 @@ def delete_template_by_id(template_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/api/v1/templates/render")
-def render_template_by_name(payload: RenderRequest, db: Session = Depends(get_db)):
+def render_template_by_name(payload: RenderRequest, db: Session = Depends(get_read_db)):
 	"""Render a template by name.
 	Request example:
-	  { "name": "welcome_email", "version": 2, "variables": { ... } }
+	  { "name": "welcome_email", "version": 2, "language": "pt-BR,pt", "variables": { ... } }
 	"""
 	try:
-		rendered = TemplateService.render_template(db, payload.name, getattr(payload, "version", None), getattr(payload, "variables", {}))
-		return APIResponse(success=True, data=rendered, error=None, message="Template rendered successfully", meta=None)
+		rendered = TemplateService.render_template(db, payload.name, getattr(payload, "version", None), getattr(payload, "variables", {}), getattr(payload, "language", None))
+		return api_success(rendered, "Template rendered successfully")
 	except ServiceException as se:
 		# if template or version missing
 		if se.status_code == 404:
@@ -183,10 +204,11 @@ def render_template_by_name(payload: RenderRequest, db: Session = Depends(get_db
 
 
 @router.get("/api/v1/templates/{name}/versions")
-def template_versions(name: str, page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+def template_versions(name: str, page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100), fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), db: Session = Depends(get_read_db)):
 	try:
-		versions, meta = TemplateService.get_versions(db, name, page=page, limit=limit)
-		return APIResponse(success=True, data=versions, error=None, message="Template versions fetched", meta=PaginationMeta.model_validate(meta))
+		selected = _select_fields(fields, VERSION_FIELDS, VERSION_FIELDS) if fields is not None else None
+		versions, meta = TemplateService.get_versions(db, name, page=page, limit=limit, fields=selected)
+		return api_success(versions, "Template versions fetched", meta=meta)
 	except ServiceException as se:
 		err = APIErrorResponse.model_validate({"success": False, "error": se.error, "message": se.message, "meta": {}})
 		return JSONResponse(status_code=se.status_code, content=err.model_dump())
@@ -53,6 +53,8 @@ class TemplateUpdate(BaseModel):
     name: Optional[str] = None
     type: Optional[str] = None
     subject: Optional[str] = None
+    # expected current version; the update is rejected with 409 if it changed
+    # (the If-Match header takes precedence when both are sent)
     version: Optional[int] = None
     content: Optional[str] = None
     language: Optional[str] = None
@@ -93,12 +95,15 @@ class TemplateVersionResponse(BaseModel):
 class RenderRequest(BaseModel):
     name: str
     version: Optional[int]= None
+    # locale or comma-separated fallback list, e.g. "pt-BR,pt"; defaults to "en"
+    language: Optional[str] = None
     variables: Dict[str, Any]
 
 
 class RenderResponse(BaseModel):
     subject: Optional[str] = None
     version: Optional[int] = None
+    language: Optional[str] = None
     content: str
 
 
@@ -1,18 +1,178 @@
 from schemas import (
     TemplateCreate,
     TemplateUpdate,
-    TemplateResponse,
     TemplateVariableCreate,
-    TemplateVariableResponse,
-    TemplateVersionResponse,
 )
 from models import template_model, template_variable_model, template_version_model
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import case
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from logger import logger
-from jinja2 import Template as JinjaTemplate
+from cache import SingleFlight, TTLCache
+from languages import build_language_chain
+from snapshot import SNAPSHOT_MODE, snapshot_env, snapshot_store
+from render_pool import RENDER_EXECUTOR, RenderBudgetExceeded, render_deadline, render_in_pool, render_with_budget
+from metrics import RENDER_BUDGET_EXCEEDED
+from jinja2 import Environment, TemplateNotFound
+from jinja_loader import CatalogLoader, DependencyGraph, collect_sources, referenced_templates
+from database import open_read_session
+from contextvars import ContextVar
+import os
 import re
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Iterable
+
+
+RESOLUTION_CACHE_TTL = float(os.getenv("TEMPLATE_RESOLUTION_CACHE_TTL", "60"))
+# negative results are only invalidated in the worker that created the template,
+# so keep them short-lived to bound staleness across workers
+NEGATIVE_RESOLUTION_CACHE_TTL = float(os.getenv("TEMPLATE_NEGATIVE_CACHE_TTL", "5"))
+
+# (name, language chain) -> resolved template id, or _NOT_FOUND
+_resolution_cache = TTLCache(max_entries=int(os.getenv("TEMPLATE_RESOLUTION_CACHE_SIZE", "10000")))
+_NOT_FOUND = object()
+
+# loaded + compiled render sources per (name, language chain, requested version);
+# other workers only see changes after the TTL
+RENDER_SOURCE_CACHE_TTL = float(os.getenv("TEMPLATE_RENDER_SOURCE_CACHE_TTL", "30"))
+_render_source_cache = TTLCache(max_entries=int(os.getenv("TEMPLATE_RENDER_SOURCE_CACHE_SIZE", "2000")))
+# concurrent misses for the same key share one DB load and compile
+_render_source_loads = SingleFlight("render_source")
+# template -> referenced layouts/partials, plus a generation per name that is
+# bumped on every change (of the template or anything it builds on), so loads
+# that raced a write are not cached
+dependency_graph = DependencyGraph()
+
+# in snapshot fallback mode, after a database error renders go straight to the
+# snapshot this long instead of each waiting for the database to fail again
+SNAPSHOT_DB_RETRY_SECONDS = float(os.getenv("TEMPLATE_SNAPSHOT_DB_RETRY_SECONDS", "10"))
+_db_down_until = 0.0
+
+
+# session of the render in progress; layouts/partials are loaded through it
+_render_session: ContextVar[Optional[Session]] = ContextVar("render_session", default=None)
+
+
+def _fetch_fragment(name: str, language: Optional[str]):
+    """CatalogLoader fetch: source of an active template referenced by another one.
+
+    Uses the session of the current render, or a read session outside of one.
+    A loaded fragment is reused until it changes in this worker or, to pick up
+    changes made by other workers, for at most TEMPLATE_RENDER_SOURCE_CACHE_TTL.
+    """
+    generation = dependency_graph.generation(name)
+    loaded_at = time.monotonic()
+    db = _render_session.get()
+    own_session = db is None
+    if own_session:
+        db = open_read_session()
+    try:
+        source = TemplateService.resolve_template(db, name, language).content
+    except ServiceException:
+        return None
+    finally:
+        if own_session:
+            db.close()
+    return source, lambda: dependency_graph.generation(name) == generation and time.monotonic() - loaded_at < RENDER_SOURCE_CACHE_TTL
+
+
+# shared environment: referenced templates are compiled once and cached here
+template_env = Environment(
+    loader=CatalogLoader(_fetch_fragment, dependency_graph),
+    cache_size=int(os.getenv("TEMPLATE_FRAGMENT_CACHE_SIZE", "400")),
+)
+
+
+def invalidate_template_cache(*names: Optional[str]) -> None:
+    """Drop cached resolutions for the given template names, and the render
+    sources of those templates and of every template that extends/includes them."""
+    for name in names:
+        if name:
+            _resolution_cache.invalidate(name)
+            for affected in dependency_graph.invalidate(name):
+                _render_source_cache.invalidate(affected)
+
+
+# Rows are serialized straight into plain dicts (same shape as the pydantic
+# response schemas) so routes can encode them once, without re-validation.
+def variable_to_dict(v: template_variable_model) -> Dict[str, Any]:
+    return {
+        "id": v.id,
+        "name": v.name,
+        "link": v.link,
+        "description": v.description,
+        "is_required": v.is_required,
+    }
+
+
+# selectable with `fields=`; everything but `variables` is a templates column
+TEMPLATE_FIELDS = (
+    "id", "name", "type", "subject", "content", "language", "version",
+    "is_active", "created_at", "updated_at", "variables",
+)
+VERSION_FIELDS = (
+    "id", "template_id", "version", "name", "type", "subject", "content",
+    "language", "changed_by", "changed_at",
+)
+
+
+def template_columns(fields: Iterable[str], required: Iterable[str] = ("id", "version")) -> List[Any]:
+    """templates columns to load for `fields`, always including `required`."""
+    names = list(dict.fromkeys([*required, *fields]))
+    return [getattr(template_model, f) for f in names if f in TEMPLATE_FIELDS and f != "variables"]
+
+
+def template_to_dict(t: template_model, variables: Optional[List[template_variable_model]] = None, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """`t` may be an entity or a row of selected columns; with `fields`, only those attributes are read."""
+    if fields is not None:
+        return {
+            f: ([variable_to_dict(v) for v in variables] if variables else None) if f == "variables" else getattr(t, f)
+            for f in fields if f in TEMPLATE_FIELDS
+        }
+    return {
+        "id": t.id,
+        "name": t.name,
+        "type": t.type,
+        "subject": t.subject,
+        "content": t.content,
+        "language": t.language,
+        "version": t.version,
+        "is_active": t.is_active,
+        "created_at": t.created_at,
+        "updated_at": t.updated_at,
+        "variables": [variable_to_dict(v) for v in variables] if variables else None,
+    }
+
+
+def version_to_dict(v: template_version_model, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        return {f: getattr(v, f) for f in fields if f in VERSION_FIELDS}
+    return {
+        "id": v.id,
+        "template_id": v.template_id,
+        "version": v.version,
+        "name": v.name,
+        "type": v.type,
+        "subject": v.subject,
+        "content": v.content,
+        "language": v.language,
+        "changed_by": v.changed_by,
+        "changed_at": v.changed_at,
+    }
+
+
+def load_variables(db: Session, template_ids: List[int]) -> Dict[int, List[template_variable_model]]:
+    """Fetch variables for many templates in one query, grouped by template id."""
+    grouped: Dict[int, List[template_variable_model]] = {tid: [] for tid in template_ids}
+    if not template_ids:
+        return grouped
+    rows = db.query(template_variable_model).filter(
+        template_variable_model.template_id.in_(template_ids)
+    ).order_by(template_variable_model.id).all()
+    for v in rows:
+        grouped[v.template_id].append(v)
+    return grouped
 
 
 class TemplateService:
@@ -37,9 +197,10 @@ class ServiceException(Exception):
 
 class TemplateService:
     @staticmethod
-    def create_template(db: Session, payload: TemplateCreate, created_by: Optional[str] = None) -> TemplateResponse:
+    def create_template(db: Session, payload: TemplateCreate, created_by: Optional[str] = None) -> Dict[str, Any]:
         # check unique name+language at DB level; check first for friendly error
-        existing = db.query(template_model).filter(
+        # soft-deleted templates don't hold the slot; the purge worker removes them later
+        existing = db.query(template_model.id).filter(
             template_model.name == payload.name,
             template_model.language == payload.language,
             template_model.is_active == True,
@@ -97,15 +258,16 @@ class TemplateService:
             db.rollback()
             raise ServiceException(400, "Validation failed", "Template name already exists for this language")
         db.refresh(tpl)
+        invalidate_template_cache(tpl.name)
 
-        vars_resp = [TemplateVariableResponse.model_validate(v) for v in variables_objs] if variables_objs else None
-
-        resp = TemplateResponse.model_validate({**tpl.__dict__, "variables": vars_resp})
+        resp = template_to_dict(tpl, variables_objs)
         logger.info(f"Template created: {tpl.name} (id={tpl.id})")
         return resp
 
     @staticmethod
-    def list_templates(db: Session, page: int = 1, limit: int = 10, search: Optional[str] = None) -> tuple[List[TemplateResponse], Dict[str, Any]]:
+    def list_templates(db: Session, page: int = 1, limit: int = 10, search: Optional[str] = None, fields: Optional[Iterable[str]] = None) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """List active templates. With `fields`, only those columns are selected and
+        variables are only queried when requested."""
         if limit > 100:
             limit = 100
         skip = (page - 1) * limit
@@ -113,12 +275,17 @@ class TemplateService:
         if search:
             q = q.filter(template_model.name.ilike(f"%{search}%"))
         total = q.count()
-        items = q.order_by(template_model.created_at.desc()).offset(skip).limit(limit).all()
-        resp_items = []
-        for t in items:
-            vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
-            vars_resp = [TemplateVariableResponse.model_validate(v) for v in vars_q] if vars_q else None
-            resp_items.append(TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp}))
+        page_q = q.order_by(template_model.created_at.desc()).offset(skip).limit(limit)
+        if fields is None:
+            items = page_q.all()
+            variables = load_variables(db, [t.id for t in items])
+            resp_items = [template_to_dict(t, variables[t.id]) for t in items]
+        else:
+            fields = list(fields)
+            # plain row tuples of the selected columns; no entities, no deferred loads
+            rows = page_q.with_entities(*template_columns(fields)).all()
+            variables = load_variables(db, [r.id for r in rows]) if "variables" in fields else {}
+            resp_items = [template_to_dict(r, variables.get(r.id), fields) for r in rows]
 
         total_pages = (total + limit - 1) // limit if total else 1
         meta = {
@@ -132,49 +299,76 @@ class TemplateService:
         return resp_items, meta
 
     @staticmethod
-    def get_template_by_name(db: Session, name: str, language: Optional[str] = "en") -> Optional[TemplateResponse]:
+    def resolve_template(db: Session, name: str, language: Optional[str] = None, fields: Optional[Iterable[str]] = None) -> template_model:
+        """Return the active template `name` in the best language of the fallback chain.
+
+        The chain is resolved in one indexed query ordered by chain position. Both
+        hits (as template id) and misses are cached per (name, chain). With `fields`,
+        only those columns are loaded.
+        """
+        options = [load_only(*template_columns(fields, ("id", "version", "name", "is_active")))] if fields is not None else []
+        chain = build_language_chain(language)
+        cached = _resolution_cache.get(name, chain)
+        if cached is _NOT_FOUND:
+            raise ServiceException(404, "NotFound", "Template not found")
+        if cached is not None:
+            t = db.get(template_model, cached, options=options)
+            if t is not None and t.is_active and t.name == name:
+                return t
+            # stale entry (changed by another worker); resolve again
+            _resolution_cache.invalidate(name)
+
+        position = case({lang: i for i, lang in enumerate(chain)}, value=template_model.language)
         t = db.query(template_model).filter(
             template_model.name == name,
-            template_model.language == language,
+            template_model.language.in_(chain),
             template_model.is_active == True,
-        ).first()
+        ).options(*options).order_by(position).first()
         if not t:
+            _resolution_cache.set(name, chain, _NOT_FOUND, NEGATIVE_RESOLUTION_CACHE_TTL)
             raise ServiceException(404, "NotFound", "Template not found")
-        vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
-        vars_resp = [TemplateVariableResponse.model_validate(v) for v in vars_q] if vars_q else None
-        return TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp})
+        _resolution_cache.set(name, chain, t.id, RESOLUTION_CACHE_TTL)
+        return t
+
+    @staticmethod
+    def get_template_by_name(db: Session, name: str, language: Optional[str] = None, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        fields = list(fields) if fields is not None else None
+        t = TemplateService.resolve_template(db, name, language, fields)
+        vars_q = None
+        if fields is None or "variables" in fields:
+            vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
+        return template_to_dict(t, vars_q, fields)
 
     @staticmethod
-    def get_template_by_id(db: Session, template_id: int) -> Optional[TemplateResponse]:
+    def get_template_by_id(db: Session, template_id: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
         """Retrieve a template by its numeric ID. Raises ServiceException(404) if not found."""
-        t = db.query(template_model).filter(
+        fields = list(fields) if fields is not None else None
+        q = db.query(template_model).filter(
             template_model.id == template_id,
             template_model.is_active == True,
-        ).first()
+        )
+        if fields is not None:
+            q = q.options(load_only(*template_columns(fields)))
+        t = q.first()
         if not t:
             raise ServiceException(404, "NotFound", "Template not found")
-        vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
-        vars_resp = [TemplateVariableResponse.model_validate(v) for v in vars_q] if vars_q else None
-        return TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp})
+        vars_q = None
+        if fields is None or "variables" in fields:
+            vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
+        return template_to_dict(t, vars_q, fields)
 
     @staticmethod
-    def update_template_by_id(db: Session, template_id: int, payload: TemplateUpdate, changed_by: Optional[str] = None) -> Optional[TemplateResponse]:
-        t = db.query(template_model).filter(template_model.id == template_id, template_model.is_active == True).first()
-        if not t:
-            raise ServiceException(404, "NotFound", "Template not found")
+    def _apply_update(db: Session, t: template_model, payload: TemplateUpdate, changed_by: Optional[str], expected_version: Optional[int]) -> Dict[str, Any]:
+        """Apply `payload` to `t` and record the new version in a single transaction.
 
-        # store current as version
-        ver = template_version_model(
-            template_id=t.id,
-            version=t.version,
-            name=t.name,
-            type=t.type,
-            subject=t.subject,
-            content=t.content,
-            language=t.language,
-            changed_by=changed_by,
-        )
-        db.add(ver)
+        `template_model.version` is the mapper's version counter, so the UPDATE only
+        matches if nobody else bumped the version since `t` was loaded. A mismatch with
+        `expected_version` (If-Match / payload.version) or a concurrent edit raises 409.
+        """
+        if expected_version is not None and expected_version != t.version:
+            raise ServiceException(409, "Conflict", f"Template version mismatch: expected {expected_version}, current is {t.version}")
+
+        old_name = t.name
 
         # apply updates
         updatable = ["name", "type", "subject", "content", "language"]
@@ -182,31 +376,29 @@ class TemplateService:
             if getattr(payload, field, None) is not None:
                 setattr(t, field, getattr(payload, field))
 
-        # increment version
+        # increment version (checked against the loaded value on flush)
         t.version = t.version + 1
 
         # variables: replace if provided
-        if getattr(payload, "variables", None) is not None:
-            # remove existing
-            db.query(template_variable_model).filter(template_variable_model.template_id == t.id).delete()
-            for v in payload.variables:
-                vv = template_variable_model(
+        if payload.variables is not None:
+            db.query(template_variable_model).filter(template_variable_model.template_id == t.id).delete(synchronize_session=False)
+            variables = [
+                template_variable_model(
                     template_id=t.id,
                     name=v.name,
+                    link=v.link,
                     description=v.description,
                     is_required=v.is_required,
                 )
-                db.add(vv)
-
-        try:
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            raise ServiceException(400, "Validation failed", "Template name already exists for this language")
-        db.refresh(t)
-
-        # create new version entry for updated state
-        new_ver = template_version_model(
+                for v in payload.variables
+            ]
+            db.add_all(variables)
+        else:
+            variables = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
+
+        # version history row for the updated state (the previous state was
+        # recorded when it was created)
+        db.add(template_version_model(
             template_id=t.id,
             version=t.version,
             name=t.name,
@@ -215,138 +407,133 @@ class TemplateService:
             content=t.content,
             language=t.language,
             changed_by=changed_by,
-        )
-        db.add(new_ver)
+        ))
+
         try:
+            db.flush()
+            # build the response before commit expires the instances
+            resp = template_to_dict(t, variables)
             db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise ServiceException(409, "Conflict", "Template was modified concurrently; reload and retry")
         except IntegrityError:
             db.rollback()
-            raise ServiceException(400, "Validation failed", "Template update conflicts with existing template name/language")
-
-        vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
-        vars_resp = [TemplateVariableResponse.model_validate(v) for v in vars_q] if vars_q else None
-        return TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp})
+            raise ServiceException(400, "Validation failed", "Template name already exists for this language")
+        invalidate_template_cache(old_name, resp["name"])
+        return resp
 
     @staticmethod
-    def delete_template_by_id(db: Session, template_id: int) -> bool:
-        t = db.query(template_model).filter(template_model.id == template_id).first()
+    def update_template_by_id(db: Session, template_id: int, payload: TemplateUpdate, changed_by: Optional[str] = None, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        t = db.query(template_model).filter(template_model.id == template_id, template_model.is_active == True).first()
         if not t:
             raise ServiceException(404, "NotFound", "Template not found")
-        db.delete(t)
-        db.commit()
-        return True
+        return TemplateService._apply_update(db, t, payload, changed_by, expected_version)
 
     @staticmethod
-    def update_template(db: Session, name: str, payload: TemplateUpdate, changed_by: Optional[str] = None) -> Optional[TemplateResponse]:
-        t = db.query(template_model).filter(template_model.name == name, template_model.is_active == True).first()
-        if not t:
-            raise ServiceException(404, "NotFound", "Template not found")
-
-        # store current as version
-        ver = template_version_model(
-            template_id=t.id,
-            version=t.version,
-            name=t.name,
-            type=t.type,
-            subject=t.subject,
-            content=t.content,
-            language=t.language,
-            changed_by=changed_by,
-        )
-        db.add(ver)
-
-        # apply updates
-        updatable = ["name", "type", "subject", "content", "language"]
-        for field in updatable:
-            if getattr(payload, field, None) is not None:
-                setattr(t, field, getattr(payload, field))
-
-        # increment version
-        t.version = t.version + 1
-
-        # variables: replace if provided
-        if payload.variables is not None:
-            # remove existing
-            db.query(template_variable_model).filter(template_variable_model.template_id == t.id).delete()
-            for v in payload.variables:
-                vv = template_variable_model(
-                    template_id=t.id,
-                    variable_name=v.variable_name,
-                    description=v.description,
-                    is_required=v.is_required,
-                )
-                db.add(vv)
-
+    def _soft_delete(db: Session, t: template_model) -> bool:
+        """Deactivate `t`; its variables and history are removed later by the purge worker (purge.py)."""
+        name = t.name
+        t.is_active = False
         try:
             db.commit()
-        except IntegrityError:
+        except StaleDataError:
             db.rollback()
-            raise ServiceException(400, "Validation failed", "Template name already exists for this language")
-        db.refresh(t)
+            raise ServiceException(409, "Conflict", "Template was modified concurrently; reload and retry")
+        invalidate_template_cache(name)
+        logger.info(f"Template soft-deleted: {name}")
+        return True
 
-        # create new version entry for updated state
-        new_ver = template_version_model(
-            template_id=t.id,
-            version=t.version,
-            name=t.name,
-            type=t.type,
-            subject=t.subject,
-            content=t.content,
-            language=t.language,
-            changed_by=changed_by,
-        )
-        db.add(new_ver)
-        try:
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            raise ServiceException(400, "Validation failed", "Template update conflicts with existing template name/language")
+    @staticmethod
+    def delete_template_by_id(db: Session, template_id: int) -> bool:
+        t = db.query(template_model).filter(template_model.id == template_id, template_model.is_active == True).first()
+        if not t:
+            raise ServiceException(404, "NotFound", "Template not found")
+        return TemplateService._soft_delete(db, t)
 
-        vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
-        vars_resp = [TemplateVariableResponse.model_validate(v) for v in vars_q] if vars_q else None
-        return TemplateResponse.model_validate({**t.__dict__, "variables": vars_resp})
+    @staticmethod
+    def update_template(db: Session, name: str, payload: TemplateUpdate, changed_by: Optional[str] = None, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        t = db.query(template_model).filter(template_model.name == name, template_model.is_active == True).first()
+        if not t:
+            raise ServiceException(404, "NotFound", "Template not found")
+        return TemplateService._apply_update(db, t, payload, changed_by, expected_version)
 
     @staticmethod
     def delete_template(db: Session, name: str) -> bool:
-        t = db.query(template_model).filter(template_model.name == name).first()
+        t = db.query(template_model).filter(template_model.name == name, template_model.is_active == True).first()
         if not t:
             raise ServiceException(404, "NotFound", "Template not found")
-        db.delete(t)
-        db.commit()
-        return True
+        return TemplateService._soft_delete(db, t)
 
     @staticmethod
-    def get_versions(db: Session, name: str, page: int = 1, limit: int = 10):
-        tpl = db.query(template_model).filter(template_model.name == name).first()
+    def get_versions(db: Session, name: str, page: int = 1, limit: int = 10, fields: Optional[Iterable[str]] = None):
+        tpl = db.query(template_model.id).filter(template_model.name == name, template_model.is_active == True).first()
         if not tpl:
             raise ServiceException(404, "NotFound", "Template not found")
         q = db.query(template_version_model).filter(template_version_model.template_id == tpl.id)
         total = q.count()
         skip = (page - 1) * limit
-        items = q.order_by(template_version_model.changed_at.desc()).offset(skip).limit(limit).all()
-        resp = [TemplateVersionResponse.model_validate(i) for i in items]
+        page_q = q.order_by(template_version_model.changed_at.desc()).offset(skip).limit(limit)
+        if fields is None:
+            resp = [version_to_dict(i) for i in page_q.all()]
+        else:
+            fields = list(fields)
+            rows = page_q.with_entities(*[getattr(template_version_model, f) for f in fields if f in VERSION_FIELDS]).all()
+            resp = [version_to_dict(r, fields) for r in rows]
         total_pages = (total + limit - 1) // limit if total else 1
         meta = {"total": total, "limit": limit, "page": page, "total_pages": total_pages, "has_next": page < total_pages, "has_previous": page > 1}
         return resp, meta
 
     @staticmethod
-    def render_template(db: Session, name: str, version: Optional[int], data: Dict[str, Any], language: Optional[str] = "en") -> Dict[str, Any]:
+    def render_template(db: Session, name: str, version: Optional[int], data: Dict[str, Any], language: Optional[str] = None) -> Dict[str, Any]:
         """Render a template by name. If `version` is provided, render using that historical version.
+        `language` may be a locale or a preference list; see `build_language_chain`.
+
+        Depending on TEMPLATE_SNAPSHOT_MODE the template is read from the catalog
+        snapshot instead of the database: always ("only") or when the database
+        is unreachable ("fallback"), in which case the database is skipped for
+        TEMPLATE_SNAPSHOT_DB_RETRY_SECONDS after each failure.
         """
-        t = db.query(template_model).filter(template_model.name == name, template_model.language == language, template_model.is_active == True).first()
-        if not t:
-            raise ServiceException(404, "NotFound", "Template not found")
-        template_version = db.query(template_model).filter(
-            template_model.version == version,
-        ).first()
-        if not template_version and version is not None:
-            raise ServiceException(404, "NotFound", "Template version not found")
+        global _db_down_until
+        try:
+            db_down = SNAPSHOT_MODE == "fallback" and time.monotonic() < _db_down_until and snapshot_store.current() is not None
+            if SNAPSHOT_MODE != "only" and not db_down:
+                session_token = _render_session.set(db)
+                try:
+                    # layouts/partials may be loaded while rendering, so the render is covered too
+                    source = TemplateService._render_source_from_db(db, name, version, language)
+                    return TemplateService._render(source, data)
+                except DBAPIError:
+                    if SNAPSHOT_MODE != "fallback" or snapshot_store.current() is None:
+                        raise
+                    _db_down_until = time.monotonic() + SNAPSHOT_DB_RETRY_SECONDS
+                    logger.warning(f"Database unavailable, rendering from catalog snapshot for the next {SNAPSHOT_DB_RETRY_SECONDS}s")
+                finally:
+                    _render_session.reset(session_token)
+            source = TemplateService._render_source_from_snapshot(name, version, language)
+            return TemplateService._render(source, data)
+        except TemplateNotFound as e:
+            # a layout/partial referenced via extends/include/import is missing
+            raise ServiceException(400, "Validation failed", f"Referenced template '{e.name}' not found")
+
+    @staticmethod
+    def _render_source_from_db(db: Session, name: str, version: Optional[int], language: Optional[str]) -> Dict[str, Any]:
+        key = (build_language_chain(language), version)
+        source = _render_source_cache.get(name, key)
+        if source is not None:
+            return source
+        return _render_source_loads.do(
+            (name,) + key,
+            lambda: TemplateService._load_render_source(db, name, version, language, key),
+        )
+
+    @staticmethod
+    def _load_render_source(db: Session, name: str, version: Optional[int], language: Optional[str], cache_key) -> Dict[str, Any]:
+        generation = dependency_graph.generation(name)
+        t = TemplateService.resolve_template(db, name, language)
         # load template variables (for validation)
         vars_q = db.query(template_variable_model).filter(template_variable_model.template_id == t.id).all()
         required = [v.name for v in vars_q if v.is_required]
-        missing = [r for r in required if r not in data]
-        if missing:
-            raise ServiceException(400, "Validation failed", f"Missing required variables: {', '.join(missing)}")
 
         # if a specific version is requested, fetch it from template_versions
         used_version = t.version
@@ -365,11 +552,81 @@ class TemplateService:
             content_template = ver_row.content
             used_type = ver_row.type
 
-        # render subject and content with jinja2
-        rendered_subject = None
+        source = {
+            "name": t.name,
+            "language": t.language,
+            "version": used_version,
+            "type": used_type,
+            "required": required,
+            "subject": subject_template,
+            "content": content_template,
+            # process-pool workers compile (and cache) on their side
+            "compiled": None,
+            "includes": None,
+        }
+        dependency_graph.record(t.name, referenced_templates(template_env, content_template))
         if subject_template:
-            rendered_subject = JinjaTemplate(subject_template).render(**data)
-        rendered_content = JinjaTemplate(content_template).render(**data)
+            dependency_graph.record(t.name, referenced_templates(template_env, subject_template))
+        if RENDER_EXECUTOR == "process":
+            # workers have no catalog access; ship every referenced layout/partial
+            source["includes"] = collect_sources(template_env, [subject_template, content_template])
+        else:
+            source["compiled"] = (
+                template_env.from_string(subject_template) if subject_template else None,
+                template_env.from_string(content_template),
+            )
+        if dependency_graph.generation(name) == generation:
+            _render_source_cache.set(name, cache_key, source, RENDER_SOURCE_CACHE_TTL)
+        return source
+
+    @staticmethod
+    def _render_source_from_snapshot(name: str, version: Optional[int], language: Optional[str]) -> Dict[str, Any]:
+        snap = snapshot_store.current()
+        if snap is None:
+            raise ServiceException(503, "ServiceUnavailable", "Template catalog snapshot is not loaded")
+        found = snap.lookup(name, build_language_chain(language))
+        if found is None:
+            raise ServiceException(404, "NotFound", "Template not found")
+        lang, entry = found
+        # snapshots only carry the active version of each template
+        if version is not None and version != entry["version"]:
+            raise ServiceException(404, "NotFound", "Template version not found")
+        content = snap.source(name, lang)
+        return {
+            "name": name,
+            "language": lang,
+            "version": entry["version"],
+            "type": entry["type"],
+            "required": entry["required"],
+            "subject": entry["subject"],
+            "content": content,
+            # in-thread renders reuse the snapshot's (pre)compiled templates
+            "compiled": (snap.template(name, lang, "subject"), snap.template(name, lang, "content")) if RENDER_EXECUTOR != "process" else None,
+            "includes": collect_sources(snapshot_env, [entry["subject"], content]) if RENDER_EXECUTOR == "process" else None,
+        }
+
+    @staticmethod
+    def _render(source: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        missing = [r for r in source["required"] if r not in data]
+        if missing:
+            raise ServiceException(400, "Validation failed", f"Missing required variables: {', '.join(missing)}")
+        used_type = source["type"]
+
+        # render subject and content with jinja2, within the render budgets
+        try:
+            if RENDER_EXECUTOR == "process":
+                key = (source["name"], source["language"], source["version"])
+                rendered_subject, rendered_content = render_in_pool(key, source["subject"], source["content"], data, source["includes"])
+            else:
+                subject_tpl, content_tpl = source["compiled"]
+                # one deadline for both fields
+                deadline = render_deadline()
+                rendered_subject = render_with_budget(subject_tpl, data, deadline=deadline) if subject_tpl is not None else None
+                rendered_content = render_with_budget(content_tpl, data, deadline=deadline)
+        except RenderBudgetExceeded as e:
+            RENDER_BUDGET_EXCEEDED.labels(reason=e.reason).inc()
+            logger.warning(f"Render of '{source['name']}' aborted: {e.message}")
+            raise ServiceException(422, "RenderBudgetExceeded", e.message)
 
         # If the template type is 'push', ensure plain text (strip HTML tags).
         if used_type == "push":
@@ -395,6 +652,6 @@ class TemplateService:
 
                 content_html = linkify(rendered_content)
                 content_html = content_html.replace('\n', '<br>')
-                rendered_content = f"<!DOCTYPE html> <meta charset=\"UTF-8\"><title>{t.name}</title><body>{content_html}</body></html>"
+                rendered_content = f"<!DOCTYPE html> <meta charset=\"UTF-8\"><title>{source['name']}</title><body>{content_html}</body></html>"
 
-        return {"subject": rendered_subject, "content": rendered_content, "version": used_version, "type": used_type}
\ No newline at end of file
+        return {"subject": rendered_subject, "content": rendered_content, "version": source["version"], "type": used_type, "language": source["language"]}
\ No newline at end of file
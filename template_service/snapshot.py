@@ -0,0 +1,259 @@
+"""Catalog snapshots: a database-independent copy of the active templates.
+
+File layout:
+
+    MAGIC (8 bytes) | header length (uint32 LE) | header (orjson) | blob
+
+The header indexes every active template by name and language (version,
+type, subject, required variables) and points into the blob for the template
+body and, optionally, the precompiled Jinja module source. The loader keeps
+the file memory-mapped and only slices bodies out of it when a template is
+rendered.
+
+Export with `python snapshot.py export [--path catalog.snapshot]`. The file is
+written to a temp path and atomically renamed, and each worker re-checks the
+file every TEMPLATE_SNAPSHOT_CHECK_INTERVAL seconds, swapping to it when its
+`snapshot_version` is newer than the one loaded.
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import orjson
+from jinja2 import Environment, TemplateSyntaxError
+from jinja2 import __version__ as JINJA_VERSION
+
+from jinja_loader import CatalogLoader
+from languages import build_language_chain
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"TPLSNAP1"
+FORMAT_VERSION = 1
+_HEADER_LEN = struct.Struct("<I")
+
+# off: never use snapshots; fallback: render from the snapshot when the
+# database is unreachable; only: render exclusively from the snapshot
+SNAPSHOT_MODE = os.getenv("TEMPLATE_SNAPSHOT_MODE", "off").lower()
+SNAPSHOT_PATH = os.getenv("TEMPLATE_SNAPSHOT_PATH", "catalog.snapshot")
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("TEMPLATE_SNAPSHOT_CHECK_INTERVAL", "5"))
+
+
+
+def _fetch_fragment(name: str, language: Optional[str]):
+    """CatalogLoader fetch: layouts/partials come from the snapshot the renderer uses."""
+    snap = snapshot_store.current()
+    found = snap.lookup(name, build_language_chain(language)) if snap is not None else None
+    if found is None:
+        return None
+    lang, _ = found
+    return snap.source(name, lang), lambda: snapshot_store.current() is snap
+
+
+# same defaults as the database path's environment; referenced templates resolve
+# against the current snapshot
+snapshot_env = Environment(loader=CatalogLoader(_fetch_fragment))
+
+
+def export_snapshot(db, path: str = SNAPSHOT_PATH, compile_templates: bool = True, snapshot_version: Optional[int] = None) -> Dict[str, Any]:
+    """Write every active template to a snapshot file at `path`; returns the header summary."""
+    from models import template_model, template_variable_model
+
+    rows = db.query(template_model).filter(template_model.is_active == True).order_by(template_model.id).all()
+    variables: Dict[int, list] = {t.id: [] for t in rows}
+    if rows:
+        for v in db.query(template_variable_model).filter(template_variable_model.template_id.in_(list(variables))).all():
+            variables[v.template_id].append(v)
+
+    blob = bytearray()
+
+    def put(text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        offset = len(blob)
+        blob.extend(data)
+        return offset, len(data)
+
+    def compiled(source: str, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            return put(snapshot_env.compile(source, name=name, raw=True))
+        except TemplateSyntaxError:
+            logger.warning(f"Template '{name}' does not compile; snapshot keeps only its source")
+            return None
+
+    templates: Dict[str, Dict[str, Any]] = {}
+    for t in rows:
+        entry = {
+            "id": t.id,
+            "version": t.version,
+            "type": t.type,
+            "subject": t.subject,
+            "content": put(t.content),
+            "required": [v.name for v in variables[t.id] if v.is_required],
+            "variables": [v.name for v in variables[t.id]],
+        }
+        if compile_templates:
+            entry["code"] = {"content": compiled(t.content, t.name)}
+            if t.subject:
+                entry["code"]["subject"] = compiled(t.subject, t.name)
+        templates.setdefault(t.name, {})[t.language] = entry
+
+    header = {
+        "format": FORMAT_VERSION,
+        "snapshot_version": snapshot_version if snapshot_version is not None else time.time_ns() // 1_000_000,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "jinja": JINJA_VERSION if compile_templates else None,
+        "count": len(rows),
+        "templates": templates,
+    }
+    header_bytes = orjson.dumps(header)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"Catalog snapshot {header['snapshot_version']} written to {path} ({len(rows)} templates)")
+    return {k: header[k] for k in ("snapshot_version", "created_at", "count")}
+
+
+class Snapshot:
+    """A loaded, memory-mapped snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a template catalog snapshot")
+        start = len(MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack(self._mm[len(MAGIC):start])
+        header = orjson.loads(self._mm[start:start + header_len])
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {header.get('format')}")
+        self.path = path
+        self.version: int = header["snapshot_version"]
+        self.created_at: str = header["created_at"]
+        self._templates: Dict[str, Dict[str, Any]] = header["templates"]
+        # precompiled code is only valid for the Jinja version that produced it
+        self._use_code = header.get("jinja") == JINJA_VERSION
+        self._blob_start = start + header_len
+        self._compiled: Dict[Tuple[str, str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(langs) for langs in self._templates.values())
+
+    def lookup(self, name: str, chain: Sequence[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return (language, entry) for the first language of `chain` present for `name`."""
+        langs = self._templates.get(name)
+        if not langs:
+            return None
+        for lang in chain:
+            if lang in langs:
+                return lang, langs[lang]
+        return None
+
+    def source(self, name: str, language: str) -> str:
+        """Template body of an entry."""
+        return self._text(self._templates[name][language]["content"])
+
+    def _text(self, span: Sequence[int]) -> str:
+        offset, length = span
+        start = self._blob_start + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def template(self, name: str, language: str, field: str):
+        """Compiled Jinja template for the `subject` or `content` of an entry, cached per snapshot."""
+        key = (name, language, field)
+        tpl = self._compiled.get(key)
+        if tpl is not None:
+            return tpl
+        entry = self._templates[name][language]
+        if field == "subject" and not entry["subject"]:
+            return None
+        code_span = (entry.get("code") or {}).get(field) if self._use_code else None
+        if code_span:
+            code = compile(self._text(code_span), name, "exec")
+            tpl = snapshot_env.template_class.from_code(snapshot_env, code, snapshot_env.make_globals(None))
+        else:
+            source = entry["subject"] if field == "subject" else self._text(entry["content"])
+            tpl = snapshot_env.from_string(source)
+        with self._lock:
+            return self._compiled.setdefault(key, tpl)
+
+
+class SnapshotStore:
+    """Holds the current snapshot of this worker and hot-swaps to newer files."""
+
+    def __init__(self, path: str = SNAPSHOT_PATH, check_interval: float = SNAPSHOT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[Snapshot] = None
+        self._file_key = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Snapshot]:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        """Load the snapshot file if it changed and is newer; returns True when swapped."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            file_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if file_key == self._file_key:
+                return False
+            self._file_key = file_key
+            try:
+                snap = Snapshot(self.path)
+            except (OSError, ValueError):
+                logger.exception(f"Could not load catalog snapshot {self.path}")
+                return False
+            if self._snapshot is not None and snap.version <= self._snapshot.version:
+                logger.warning(f"Ignoring catalog snapshot {snap.version}; {self._snapshot.version} is already loaded")
+                return False
+            # the previous mapping stays valid for renders still holding it
+            self._snapshot = snap
+        logger.info(f"Loaded catalog snapshot {snap.version} ({len(snap)} templates) from {self.path}")
+        return True
+
+
+snapshot_store = SnapshotStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template catalog snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write the active catalog to a snapshot file")
+    export.add_argument("--path", default=SNAPSHOT_PATH)
+    export.add_argument("--no-compile", action="store_true", help="store template sources only")
+    export.add_argument("--snapshot-version", type=int, default=None, help="defaults to the current time in ms")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        summary = export_snapshot(db, args.path, compile_templates=not args.no_compile, snapshot_version=args.snapshot_version)
+    finally:
+        db.close()
+    print(orjson.dumps(summary).decode())
+
+
+if __name__ == "__main__":
+    main()